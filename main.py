@@ -1,73 +1,233 @@
 """
 Gets blog posts and stores in Amazon s3
 """
+import itertools
+import os
+from functools import partial
+from workers.bedrock_worker import SUPPORTED_MODELS, BedrockWorker
+from workers.blog_record import BlogRecord
 from workers.blog_worker import BlogPost
+from workers.cache_worker import CacheWorker
+from workers.change_worker import ChangeLogWorker
+from workers.enrich_worker import EnrichWorker
+from workers.error_worker import ErrorWorker, WALInUseError, is_transient
+from workers.queue_worker import SQLiteQueue, SQSQueue, WorkQueue
 from workers.s3_worker import S3Worker
+from workers.sink_worker import SinkWorker
 
 
-def main(aws_blog_home_url: str, bucket_name: str) -> str:
+def main(aws_blog_home_url: str, bucket_name: str,
+         dead_letter_file: str="dead_letter.jsonl", cache: CacheWorker=None,
+         table_name: str=None, batch_size: int=25, flush_interval: float=5.0,
+         wal_file: str="sink.wal", manifest_dir: str="manifests",
+         enrich: bool=False, model_id: str="anthropic.claude-v2",
+         queue: WorkQueue=None, visibility_timeout: int=300, max_receives: int=5,
+         idle_polls: int=3) -> str:
     """
     Process AWS blogs from a aws_blog_home_url and save to S3.
 
     This function takes a URL pointing to a list of AWS blog 
     posts and a S3 bucket name. It will retrieve each blog 
     post, extract the metadata and body, generate a filename,
-    and save the file directly to the S3 bucket.
+    and save the file directly to the S3 bucket. If a table name is
+    given, the metadata of each post is also written to DynamoDB.
+
+    Posts are parsed once and buffered. The buffer is flushed to S3
+    and DynamoDB at the same time, in batches, while parsing goes on.
+
+    A post that fails is written to the dead-letter file with the
+    reason and the run moves on to the next post.
+
+    If a queue is given, the urls are leased from the queue instead of
+    crawled from aws_blog_home_url, and each url is acked once its post
+    is written. A url whose post failed to write is released for a retry. Run enqueue_blogs on one host and this on any number of
+    hosts to split an archive across them.
 
     Args:
         aws_blog_home_url (str):            The URL of the AWS blog list 
         bucket_name (str):                  The name of the S3 bucket to save files
+        dead_letter_file (str):             The file failed urls are appended to
+        cache (CacheWorker) Optional:       On-disk cache of raw blog pages
+        table_name (str) Optional:          The DynamoDB table to write metadata to
+        batch_size (int):                   Number of posts that triggers a flush
+        flush_interval (float):             Seconds between flushes of a partial batch
+        wal_file (str):                     The write-ahead log of unflushed posts.
+                                            With a queue, each worker process uses its own
+                                            numbered log next to it
+        manifest_dir (str):                 The directory the run manifest of S3 changes is saved in
+        enrich (bool):                      If True, summarize and tag new posts with Bedrock
+        model_id (str):                     The Bedrock model used to enrich posts
+        queue (WorkQueue) Optional:         The shared queue to lease urls from
+        visibility_timeout (int):           Seconds a leased url is hidden from other workers
+        max_receives (int):                 Leases of a url before a transient failure is final
+        idle_polls (int):                   Empty leases in a row before the worker stops
 
     Returns: 
         blog_list (list):                   The list of processed blog dictionaries
 
     """
-    worker = BlogPost()
-    s3 = S3Worker(bucket_name)
-    blog_list = get_aws_blogs_list(worker, aws_blog_home_url)
-    # Takes the aws blog urls and gets the data about each blog and returns a list of dictionaries
-    i =0
-    for blog in blog_list:
-        # Gets the soup of the blog
-        soup = worker.get_soup(blog)
-        # Gets the blog dict meta-data
-        blog_dict = worker.get_blog_dict(soup)
-        # Generates a string for the S3 file name
-        blog_title = get_title_string(blog_dict)
-        # Gets the blog body
-        blog_body = worker.get_blog_body(soup)
-        # Writes the blog body to S3
-        s3.write_file_directly_to_s3(file_name=blog_title, data=blog_body)
-        i += 1
-        print(f"{str(i)}. {blog_title}")
-    print(f"Completed successfully.\nTotal number of blogs: {str(i)}")
+    worker = BlogPost(cache=cache)
+    # Saves the changes of earlier runs that were killed before their manifest
+    ChangeLogWorker.recover(manifest_dir)
+    change_log = ChangeLogWorker(manifest_dir, bucket_name)
+    s3 = S3Worker(bucket_name, change_log=change_log)
+    errors = ErrorWorker(dead_letter_file)
+    sinks = {"s3": s3.write_records}
+    db = None
+    if table_name:
+        # Imported here so its log setup only runs when DynamoDB is used
+        from workers.db_worker import DynamoDBWorker
+        db = DynamoDBWorker(table_name)
+        sinks["dynamodb"] = db.post_records
+    after = {}
+    on_failed = None
+    if queue is not None:
+        # Written posts are acked, failed ones go back to the queue for a retry
+        after["ack"] = queue.ack_records
+        on_failed = partial(queue.release_records, max_receives=max_receives)
+    if enrich:
+        # Runs once a batch is in S3/DynamoDB so it can update the new items
+        after["enrich"] = EnrichWorker(BedrockWorker(), s3=s3, db=db,
+                                       model_id=model_id).enrich_records
+    # A post only counts as a success once every sink wrote it
+    sink_args = dict(batch_size=batch_size, flush_interval=flush_interval, after=after,
+                     on_written=lambda records: errors.record_success(len(records)),
+                     on_failed=on_failed)
+    if queue is None:
+        sink = SinkWorker(sinks, errors, wal_file=wal_file, **sink_args)
+    else:
+        # Workers on one host each take the first free log, ex: sink.0.wal,
+        # so a restarted worker replays the log of one that died
+        root, ext = os.path.splitext(wal_file)
+        for slot in itertools.count():
+            try:
+                sink = SinkWorker(sinks, errors, wal_file=f"{root}.{slot}{ext}", **sink_args)
+                break
+            except WALInUseError:
+                continue
+    try:
+        if queue is not None:
+            blog_list = work_queue(worker, sink, queue, errors, visibility_timeout,
+                                   max_receives, idle_polls)
+        else:
+            blog_list = get_aws_blogs_list(worker, aws_blog_home_url, errors)
+            # Takes the aws blog urls and gets the data about each blog and returns a list of dictionaries
+            for count, blog in enumerate(blog_list, start=1):
+                try:
+                    record = process_blog(worker, sink, blog)
+                except Exception as e:
+                    errors.record_failure(blog, e, stage="process")
+                    continue
+                print(f"{count}. {record.s3_key}")
+    finally:
+        sink.close()
+        change_log.save()
+    print("Completed.")
+    errors.report()
     return blog_list
 
-def get_title_string(blog_dict: dict) -> str:
+def process_blog(aws_blog_worker: BlogPost, sink: SinkWorker, blog_url: str) -> BlogRecord:
     """
-    Generates a string for the S3 file name.
+    Gets a single blog post and adds it to the sink buffer.
 
     Args:
-        blog_dict (dict):       blog dict
+        aws_blog_worker (BlogPost):     BlogPost object
+        sink (SinkWorker):              SinkWorker object
+        blog_url (str):                 The URL of the blog post
     Returns:
-        str: s3 file name string.
+        BlogRecord: the processed blog post
     """
-    date_published = blog_dict.get("date_published", None)
-    blog_title = blog_dict.get("blog_title", None)
-    if date_published and blog_title:
-        title =  blog_title + " " + date_published
-    else:
-        raise ValueError("date_published and blog_title are required.")
-    s3_file_name = S3Worker.generate_filename(title)
-    return s3_file_name
+    # Gets the soup of the blog
+    soup = aws_blog_worker.get_soup(blog_url)
+    if soup is None:
+        raise ValueError(f"Could not get the soup of {blog_url}")
+    # Gets the blog meta-data and body as one record
+    record = aws_blog_worker.get_blog_record(soup)
+    # Queues the record for S3 and DynamoDB
+    sink.add(record)
+    return record
+
+def work_queue(aws_blog_worker: BlogPost, sink: SinkWorker, queue: WorkQueue,
+               errors: ErrorWorker, visibility_timeout: int=300, max_receives: int=5,
+               idle_polls: int=3) -> list:
+    """
+    Leases blog urls from a shared queue and processes them until it is empty.
+
+    Posts are acked by the sink once every sink wrote them. A transient
+    failure, while processing or writing, releases the url so any worker
+    can retry it, up to max_receives leases. Other failures are final
+    and acked.
+
+    Args:
+        aws_blog_worker (BlogPost):     BlogPost object
+        sink (SinkWorker):              SinkWorker object
+        queue (WorkQueue):              The shared queue to lease urls from
+        errors (ErrorWorker):           ErrorWorker to record failed urls
+        visibility_timeout (int):       Seconds a leased url is hidden from other workers
+        max_receives (int):             Leases of a url before a transient failure is final
+        idle_polls (int):               Empty leases in a row before stopping
+    Returns:
+        list: list of leased blog urls
+    """
+    blog_list = []
+    idle = 0
+    while idle < idle_polls:
+        leased = queue.lease(max_items=10, visibility_timeout=visibility_timeout)
+        if not leased:
+            idle += 1
+            continue
+        idle = 0
+        for blog, receive_count in leased:
+            blog_list.append(blog)
+            try:
+                record = process_blog(aws_blog_worker, sink, blog)
+            except Exception as e:
+                if is_transient(e) and receive_count < max_receives:
+                    print(f"Releasing {blog} for retry ({receive_count}/{max_receives}). Error: {e}")
+                    queue.release(blog)
+                    continue
+                errors.record_failure(blog, e, stage="process")
+                queue.ack(blog)
+                continue
+            print(f"{len(blog_list)}. {record.s3_key}")
+    return blog_list
+
+def enqueue_blogs(aws_blog_home_url: str, queue: WorkQueue, cache: CacheWorker=None,
+                  dead_letter_file: str="dead_letter.jsonl") -> list:
+    """
+    Crawls the listing pages of a blog and adds every post url to a shared queue.
+
+    The urls of each listing page are enqueued as soon as the page is
+    read, so workers get their first urls before the crawl is done.
+
+    Args:
+        aws_blog_home_url (str):        The URL of the AWS blog list
+        queue (WorkQueue):              The shared queue to add urls to
+        cache (CacheWorker) Optional:   On-disk cache of raw blog pages
+        dead_letter_file (str):         The file failed listing pages are appended to
+    Returns:
+        list: list of aws blog urls
+    """
+    errors = ErrorWorker(dead_letter_file)
+    # Enqueues each listing page as it is read so workers can start right away
+    blog_list = get_aws_blogs_list(BlogPost(cache=cache), aws_blog_home_url, errors,
+                                   on_page=queue.enqueue)
+    print(f"Enqueued {len(blog_list)} blogs.")
+    return blog_list
 
-def get_aws_blogs_list(aws_blog_worker: BlogPost, aws_blog_home_url: str) -> list:
+def get_aws_blogs_list(aws_blog_worker: BlogPost, aws_blog_home_url: str,
+                       errors: ErrorWorker=None, on_page=None) -> list:
     """
     Gets a list of aws blog urls.
 
+    A listing page that cannot be fetched ends the crawl with the
+    urls found so far.
+
     Args:
         aws_blog_worker (BlogPost):     BlogPost object
         aws_blog_home_url (str):        The URL of the AWS blog list 
+        errors (ErrorWorker) Optional:  ErrorWorker to record failed pages
+        on_page (callable) Optional:    Called with the new urls of each listing page
     Returns:
         list: list of aws blog urls
     """
@@ -77,12 +237,22 @@ def get_aws_blogs_list(aws_blog_worker: BlogPost, aws_blog_home_url: str) -> lis
     # Compiles a list of aws blog urls
     while next_page:
         seen_pages.append(next_page)
-        soup = worker.get_soup(next_page)
-        if soup:
-            worker.get_all_url_links_on_page(soup)
-            next_page = worker.check_pagination(soup)
-            if next_page in seen_pages:
-                break
+        try:
+            soup = worker.get_soup(next_page)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.record_failure(next_page, e, stage="listing")
+            break
+        if not soup:
+            break
+        found = len(worker.links)
+        worker.get_all_url_links_on_page(soup)
+        if on_page is not None and len(worker.links) > found:
+            on_page(worker.links[found:])
+        next_page = worker.check_pagination(soup)
+        if next_page in seen_pages:
+            break
 
     return aws_blog_worker.links
 
@@ -93,5 +263,62 @@ if __name__ == "__main__":
     parser.add_argument("--aws_blog_home_url", help="The URL of the AWS blog list. \
                         Ex: https://aws.amazon.com/blogs/networking-and-content-delivery/")
     parser.add_argument("--bucket_name", help="The name of the S3 bucket to save files")
+    parser.add_argument("--dead_letter_file", default="dead_letter.jsonl",
+                        help="The file failed urls and reasons are appended to")
+    parser.add_argument("--cache_dir", default=None,
+                        help="Directory to cache raw blog pages in. Disabled if not set")
+    parser.add_argument("--cache_max_mb", type=int, default=1024,
+                        help="Maximum size of the page cache in megabytes")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only read pages from the cache, never the network")
+    parser.add_argument("--table_name", default=None,
+                        help="The DynamoDB table to write post metadata to. Disabled if not set")
+    parser.add_argument("--batch_size", type=int, default=25,
+                        help="Number of posts written to S3/DynamoDB per flush")
+    parser.add_argument("--flush_interval", type=float, default=5.0,
+                        help="Seconds between flushes of a partial batch")
+    parser.add_argument("--wal_file", default="sink.wal",
+                        help="The write-ahead log of posts not yet written")
+    parser.add_argument("--manifest_dir", default="manifests",
+                        help="The directory the run manifest of S3 changes is saved in")
+    parser.add_argument("--enrich", action="store_true",
+                        help="Summarize and tag new posts with Amazon Bedrock")
+    parser.add_argument("--model_id", default="anthropic.claude-v2", choices=SUPPORTED_MODELS,
+                        help="The Bedrock model used to enrich posts")
+    parser.add_argument("--mode", choices=["local", "coordinator", "worker"], default="local",
+                        help="local crawls and processes on this host. coordinator only \
+                        enqueues post urls. worker processes urls from the queue")
+    parser.add_argument("--queue_url", default=None,
+                        help="The SQS queue url shared by the coordinator and workers")
+    parser.add_argument("--queue_path", default=None,
+                        help="A local SQLite file to use as the queue instead of SQS")
+    parser.add_argument("--visibility_timeout", type=int, default=300,
+                        help="Seconds a leased url is hidden from other workers")
+    parser.add_argument("--max_receives", type=int, default=5,
+                        help="Leases of a url before a transient failure is final")
+    parser.add_argument("--idle_polls", type=int, default=3,
+                        help="Empty polls of the queue in a row before a worker stops")
     args = parser.parse_args()
-    main(args.aws_blog_home_url, args.bucket_name)
+    if args.offline and not args.cache_dir:
+        parser.error("--offline requires --cache_dir")
+    page_cache = None
+    if args.cache_dir:
+        page_cache = CacheWorker(args.cache_dir, max_size_mb=args.cache_max_mb,
+                                 offline=args.offline)
+    work = None
+    if args.mode != "local":
+        if args.queue_url:
+            work = SQSQueue(args.queue_url)
+        elif args.queue_path:
+            work = SQLiteQueue(args.queue_path)
+        else:
+            parser.error(f"--mode {args.mode} requires --queue_url or --queue_path")
+    if args.mode == "coordinator":
+        enqueue_blogs(args.aws_blog_home_url, work, page_cache, args.dead_letter_file)
+    else:
+        main(args.aws_blog_home_url, args.bucket_name, args.dead_letter_file, page_cache,
+             table_name=args.table_name, batch_size=args.batch_size,
+             flush_interval=args.flush_interval, wal_file=args.wal_file,
+             manifest_dir=args.manifest_dir, enrich=args.enrich, model_id=args.model_id,
+             queue=work, visibility_timeout=args.visibility_timeout,
+             max_receives=args.max_receives, idle_polls=args.idle_polls)
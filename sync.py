@@ -0,0 +1,50 @@
+"""
+Syncs new and changed blog posts in S3 to a knowledge base
+"""
+from workers.sync_worker import BedrockKBTarget, LocalIngestionTarget, SyncWorker
+
+
+def sync(manifest_dir: str="manifests", knowledge_base_id: str=None,
+         data_source_id: str=None, local_target: str=None,
+         region_name: str="us-east-1") -> dict:
+    """
+    Sends the S3 changes recorded since the last sync to a knowledge base.
+
+    Each run of main.py saves a manifest of the S3 keys it added,
+    updated or deleted. Only the manifests not synced yet are read,
+    so the cost of a sync grows with the new posts and not with the
+    size of the bucket.
+
+    Args:
+        manifest_dir (str):             The directory main.py saved manifests in
+        knowledge_base_id (str):        The ID of the Bedrock knowledge base
+        data_source_id (str):           The ID of the knowledge base S3 data source
+        local_target (str) Optional:    A JSON file to sync to instead of Bedrock
+        region_name (str):              The region of the knowledge base
+
+    Returns:
+        dict: number of documents ingested and deleted
+    """
+    if local_target:
+        target = LocalIngestionTarget(local_target)
+    elif knowledge_base_id and data_source_id:
+        target = BedrockKBTarget(knowledge_base_id, data_source_id, region_name)
+    else:
+        raise ValueError("knowledge_base_id and data_source_id, or local_target, are required.")
+    return SyncWorker(target, manifest_dir).sync()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync new blog posts in S3 to a knowledge base.")
+    parser.add_argument("--manifest_dir", default="manifests",
+                        help="The directory main.py saved run manifests in")
+    parser.add_argument("--knowledge_base_id", help="The ID of the Bedrock knowledge base")
+    parser.add_argument("--data_source_id", help="The ID of the knowledge base S3 data source")
+    parser.add_argument("--local_target", default=None,
+                        help="A JSON file to sync to instead of Bedrock, for testing")
+    parser.add_argument("--region_name", default="us-east-1",
+                        help="The region of the knowledge base")
+    args = parser.parse_args()
+    sync(args.manifest_dir, args.knowledge_base_id, args.data_source_id,
+         args.local_target, args.region_name)
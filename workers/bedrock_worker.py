@@ -2,11 +2,17 @@ import boto3
 import os
 import json
 from pprint import pprint
+from workers.error_worker import retry_with_backoff
 
 
 SERVICE_NAME = 'bedrock'
+RUNTIME_SERVICE_NAME = 'bedrock-runtime'
 REGION_NAME = 'us-west-2'
 ENDPOINT_URL = 'https://bedrock.us-west-2.amazonaws.com'
+ANTHROPIC_MODELS = ['anthropic.claude-v1', 'anthropic.claude-v2', 'anthropic.claude-instant-v1']
+AMAZON_MODELS = ['amazon.titan-tg1-large', 'amazon.titan-e1t-medium']
+# Models prompt() knows how to call
+SUPPORTED_MODELS = ANTHROPIC_MODELS + AMAZON_MODELS
 
 
 class BedrockWorker:
@@ -21,14 +27,17 @@ class BedrockWorker:
         
         Attributes:
             bedrock (client):       Boto3 Bedrock client
+            bedrock_runtime (client): Boto3 Bedrock runtime client used to invoke models
             models (list):          List of available model IDs
             prompt_data (str):      Prompt text for model
             prompt_response (dict): Generated response for prompt
         """
-        self.service_name = SERVICE_NAME
-        self.region_name = REGION_NAME
-        self.endpoint_url = ENDPOINT_URL
+        self.service_name = service_name
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
         self.bedrock = self.connect()
+        self.bedrock_runtime = boto3.client(service_name=RUNTIME_SERVICE_NAME,
+                                            region_name=self.region_name)
         self.models = self.__get_models()
         self.prompt_data = None
         self.prompt_response = None
@@ -69,9 +78,15 @@ class BedrockWorker:
             maxTokenCount (int):    Maximum number of tokens to generate
             stop_sequences (list):  Stop sequences to prevent model generating
         
+        Raises:
+            ValueError: if prompt() does not support the model
+
         Returns:
             dict: Dictionary containing model_id and generated response body
         """
+        if model_id not in SUPPORTED_MODELS:
+            raise ValueError(f"Model {model_id} is not supported. "
+                             f"Use one of: {', '.join(SUPPORTED_MODELS)}")
         if model_id not in self.models:
             raise Exception(f"Model {model_id} does not exist")
         
@@ -86,7 +101,7 @@ class BedrockWorker:
             "maxTokenCount": maxTokenCount,
             "stop_sequences": stop_sequences
         }
-        if model_id == 'anthropic.claude-v1' or model_id == 'anthropic.claude-v2' or model_id == 'anthropic.claude-instant-v1':
+        if model_id in ANTHROPIC_MODELS:
             response_body = self.get_prompt_anthropic(**payload)
             response = {
                 "model_id": model_id,
@@ -95,7 +110,7 @@ class BedrockWorker:
             self.prompt_response = response
             return response
         
-        elif model_id == 'amazon.titan-tg1-large' or model_id == 'amazon.titan-e1t-medium':
+        else:
             response_body = self.get_prompt_amazon(**payload)
             response = {
                 "model_id": model_id,
@@ -123,14 +138,13 @@ class BedrockWorker:
         Returns:
             dict: API response JSON containing generated text
         """
-        models = ['anthropic.claude-v1', 'anthropic.claude-v2', 'anthropic.claude-instant-v1']
         try:
-            if model_id not in models:
+            if model_id not in ANTHROPIC_MODELS:
                 raise Exception(f"Model {model_id} is not an anthropic model.")
             payload = {
                 "body": json.dumps(
                     {
-                        "prompt": f"\n\nHuman: {prompt_data}\nAssistant:",
+                        "prompt": f"\n\nHuman: {prompt_data}\n\nAssistant:",
                         "max_tokens_to_sample": maxTokenCount,
                         "temperature": temperature,
                         "top_k": topk,
@@ -143,12 +157,12 @@ class BedrockWorker:
                 "contentType": 'application/json'
                 }
                 
-            response = self.bedrock.invoke_model(**payload)
+            response = retry_with_backoff(self.bedrock_runtime.invoke_model, **payload)
             response_body = json.loads(response.get('body').read())
             return response_body
         except Exception as e:
             print(e)
-            exit(1)
+            raise
     
     def get_prompt_amazon(self, prompt_data, model_id='anthropic.claude-v2', temperature = 1,
                topP = 1.0, topk = 250, maxTokenCount = 4096, stop_sequences = []):
@@ -169,9 +183,8 @@ class BedrockWorker:
         Returns:
             dict: API response JSON containing generated text
         """
-        models = ['amazon.titan-tg1-large', 'amazon.titan-e1t-medium']
         try:
-            if model_id not in models:
+            if model_id not in AMAZON_MODELS:
                 raise Exception(f"Model {model_id} is not an amazon titan model.")
             payload = {
                 "modelId":  model_id,
@@ -190,12 +203,12 @@ class BedrockWorker:
                 )
                 
             }
-            response = self.bedrock.invoke_model(**payload)
+            response = retry_with_backoff(self.bedrock_runtime.invoke_model, **payload)
             response_body = json.loads(response.get('body').read())
             return response_body
         except Exception as e:
             print(e)
-            exit(1)
+            raise
 
 if __name__ == "__main__":
     from langchain.prompts import PromptTemplate
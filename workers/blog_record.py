@@ -0,0 +1,131 @@
+"""
+Structured record of a single blog post
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field, fields
+from workers.s3_worker import S3Worker
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+@dataclass(slots=True)
+class BlogRecord:
+    """
+    A parsed blog post: its metadata, body, content hash and S3 key
+
+    The content hash and S3 key are derived once when the record is
+    created and carried through every worker from there.
+
+    :Example:
+        record = BlogRecord.from_blog_dict(blog_dict, body)
+        s3.write_record(record)
+    """
+    url: str
+    category: str
+    blog_title: str
+    date_published: str
+    authors: list = field(default_factory=list)
+    tags: list = None
+    body: str = ""
+    content_hash: str = None
+    s3_key: str = None
+
+    def __post_init__(self):
+        if self.content_hash is None:
+            self.content_hash = hashlib.sha256(self.body.encode("utf-8")).hexdigest()
+        if self.s3_key is None:
+            self.s3_key = S3Worker.generate_key(self.blog_title, self.date_published)
+
+    @classmethod
+    def from_blog_dict(cls, blog_dict: dict, body: str) -> "BlogRecord":
+        """
+        Creates a record from a BlogPost.get_blog_dict dict and body
+
+        Args:
+            blog_dict (dict):       blog dict
+            body (str):             body of the blog post
+
+        Returns:
+            BlogRecord: the record
+        """
+        return cls(
+            url=blog_dict.get("url"),
+            category=blog_dict.get("category"),
+            blog_title=blog_dict.get("blog_title"),
+            date_published=blog_dict.get("date_published"),
+            authors=blog_dict.get("authors") or [],
+            tags=blog_dict.get("tags"),
+            body=body,
+        )
+
+    def metadata(self) -> dict:
+        """
+        Returns the metadata of the post without the body
+
+        Returns:
+            dict: blog dict plus content_hash and s3_key
+        """
+        return {
+            "category": self.category,
+            "blog_title": self.blog_title,
+            "authors": self.authors,
+            "date_published": self.date_published,
+            "tags": self.tags,
+            "url": self.url,
+            "content_hash": self.content_hash,
+            "s3_key": self.s3_key,
+        }
+
+    def to_dict(self) -> dict:
+        """
+        Returns all fields of the record as a dict
+        """
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BlogRecord":
+        """
+        Creates a record from the output of to_dict
+        """
+        return cls(**data)
+
+    def to_json(self) -> str:
+        """
+        Serializes the record to a JSON string
+        """
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: str) -> "BlogRecord":
+        """
+        Creates a record from a JSON string
+        """
+        return cls.from_dict(json.loads(data))
+
+    def to_msgpack(self) -> bytes:
+        """
+        Serializes the record to msgpack bytes
+
+        Raises:
+            ImportError: if msgpack is not installed
+        """
+        if msgpack is None:
+            raise ImportError("msgpack is required for BlogRecord.to_msgpack")
+        # Field order is fixed, so pack values only and skip the key names
+        return msgpack.packb([getattr(self, f.name) for f in fields(self)])
+
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> "BlogRecord":
+        """
+        Creates a record from msgpack bytes
+
+        Raises:
+            ImportError: if msgpack is not installed
+        """
+        if msgpack is None:
+            raise ImportError("msgpack is required for BlogRecord.from_msgpack")
+        return cls(*msgpack.unpackb(data))
@@ -1,10 +1,13 @@
 """
 Gets Blog Posts data and summarizes it
 """
-import sys
+from abc import ABC, abstractmethod
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
+from workers.blog_record import BlogRecord
+from workers.error_worker import (TRANSIENT_STATUS_CODES, TransientError,
+                                  UnsupportedLayoutError, retry_with_backoff)
 
 
 # Create a class that will be used to gather filter and return blog posts from websites
@@ -12,16 +15,29 @@ class BlogPost:
     """
     Class that will be used to gather filter and return blog posts from websites
     """
-    def __init__(self):
+    def __init__(self, cache=None):
         """
         Method to initialize the class
+
+        Args:
+            cache (CacheWorker) Optional: on-disk cache of raw pages
         """
         self.url = None
         self.links = []
+        self.cache = cache
+        # Extractor that last matched each blog, ex: {"aws.amazon.com/blogs/aws": ...}
+        self._layouts = {}
+        self._last_soup = None
+        self._last_extractor = None
 
     def get_soup(self, url=None) -> BeautifulSoup:
         """
         Gets the soup of the website
+
+        Transient errors (timeouts, 429 and 5xx responses) are retried
+        with exponential backoff before giving up. If a cache is set, the
+        cached page is revalidated with its ETag/Last-Modified, or served
+        without a request at all when the cache is offline.
         
         Args:
             url (str): url of the website
@@ -29,12 +45,60 @@ class BlogPost:
         Returns:
             BeautifulSoup: soup of the website
         """
-        response = requests.get(url, timeout=10)
+        text = self.get_page(url)
+        if text is None:
+            return None
+        self.url = url
+        return BeautifulSoup(text, "html.parser")
+
+    def get_page(self, url: str) -> str:
+        """
+        Gets the raw html of the website, using the cache if set
+
+        Args:
+            url (str): url of the website
+
+        Returns:
+            str: html of the website
+        """
+        if self.cache is not None and self.cache.offline:
+            text = self.cache.get(url)
+            if text is None:
+                print(f"Error: {url} is not in the cache (offline mode)")
+            return text
+        headers = self.cache.validators(url) if self.cache is not None else {}
+        response = retry_with_backoff(self._get, url, headers)
+        if response.status_code == 304 and self.cache is not None:
+            text = self.cache.get(url)
+            if text is not None:
+                return text
+            # Entry was evicted between the check and now, fetch it again
+            response = retry_with_backoff(self._get, url)
         if response.status_code != 200:
             print("Error: Could not get the soup of the website")
             return None
-        self.url = url
-        return BeautifulSoup(response.text, "html.parser")
+        if self.cache is not None:
+            self.cache.put(url, response.text,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"))
+        return response.text
+
+    @staticmethod
+    def _get(url: str, headers: dict=None) -> requests.Response:
+        """
+        GETs a url and raises TransientError on retryable status codes
+
+        Args:
+            url (str): url of the website
+            headers (dict) Optional: request headers
+
+        Returns:
+            requests.Response: response of the website
+        """
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            raise TransientError(f"{url} returned HTTP {response.status_code}")
+        return response
 
     def get_all_url_links_on_page(self, soup=BeautifulSoup):
         """
@@ -70,13 +134,191 @@ class BlogPost:
                     return None
             else:
                 return None
-        except NameError as e:
-            sys.exit(e)
+        except (AttributeError, TypeError) as e:
+            # A pagination div without a usable link ends the crawl, not the run
+            print(f"Error: Could not read pagination on {self.url}. Error: {e}")
+            return None
 
     def get_blog_body(self, soup=BeautifulSoup):
         """
         GETS the body of a blog post
 
+        Args:
+            soup (BeautifulSoup): soup of the website
+
+        Returns:
+            str: body of a blog post
+        """
+        if soup is self._last_soup:
+            extractor = self._last_extractor
+        else:
+            extractor = self.get_extractor(soup)
+        return extractor.get_blog_body(soup)
+
+    def get_blog_dict(self, soup=BeautifulSoup) -> dict:
+        """
+        Returns the blog dict
+
+        The extractor that matched the last page of the same blog is
+        tried first. Layout detection only runs when it does not fit.
+        Extractors registered ahead of the cached one are still checked,
+        so a newer page is never parsed with an older layout.
+        
+        Raises:
+            UnsupportedLayoutError: if the page layout is not supported
+
+        Returns:
+            dict: blog attributes as a dict
+        """
+        section = self._section(self.url)
+        extractor = self._layouts.get(section)
+        if extractor is not None and \
+                not any(e.detect(soup) for e in EXTRACTORS[:EXTRACTORS.index(extractor)]):
+            try:
+                post_data = extractor.get_blog_dict(self, soup)
+                self._last_soup, self._last_extractor = soup, extractor
+                return post_data
+            except UnsupportedLayoutError:
+                pass
+        extractor = self.get_extractor(soup, skip_cache=True)
+        post_data = extractor.get_blog_dict(self, soup)
+        self._last_soup, self._last_extractor = soup, extractor
+        return post_data
+
+    def get_blog_record(self, soup=BeautifulSoup) -> BlogRecord:
+        """
+        Returns the metadata and body of a blog post as one record
+
+        Args:
+            soup (BeautifulSoup): soup of the website
+
+        Raises:
+            UnsupportedLayoutError: if the page layout is not supported
+
+        Returns:
+            BlogRecord: the blog post
+        """
+        blog_dict = self.get_blog_dict(soup)
+        return BlogRecord.from_blog_dict(blog_dict, self.get_blog_body(soup))
+
+    def get_extractor(self, soup=BeautifulSoup, skip_cache: bool=False):
+        """
+        Returns the extractor for the layout of a page
+
+        Args:
+            soup (BeautifulSoup): soup of the website
+            skip_cache (bool): if True, always run layout detection
+
+        Raises:
+            UnsupportedLayoutError: if no registered extractor matches
+
+        Returns:
+            BlogExtractor: extractor for the page
+        """
+        section = self._section(self.url)
+        if not skip_cache and section in self._layouts:
+            return self._layouts[section]
+        for extractor in EXTRACTORS:
+            if extractor.detect(soup):
+                self._layouts[section] = extractor
+                return extractor
+        raise UnsupportedLayoutError(f"{self.url} does not match any supported layout.")
+
+    @staticmethod
+    def _section(url: str) -> str:
+        """
+        Returns the blog a url belongs to
+        ex: https://aws.amazon.com/blogs/security/post-name/ -> aws.amazon.com/blogs/security
+
+        Args:
+            url (str): url of the website
+
+        Returns:
+            str: blog section of the url
+        """
+        if not url:
+            return None
+        parts = url.split("://", 1)[-1].split("/")
+        if len(parts) > 2 and parts[1] == "blogs":
+            return "/".join(parts[:3])
+        return parts[0]
+
+    ## Get tags from text file.
+    def get_tags(self, blog_title_tags: list) -> list:
+        """
+        GETS list of blog tags
+        
+        Args:
+            blog_title_tags (list): list of tags from blog title
+
+        Returns:
+            list: list of tags
+        """
+        tags = []
+        with open('aws_services.txt', encoding="utf-8") as f:
+            lines = [line.rstrip().lower() for line in f]
+            for tag in lines:
+                if tag in blog_title_tags:
+                    tags.append(tag.lower())
+            return tags
+
+
+# Extractors tried in order during layout detection. Add new layouts with @register_extractor.
+EXTRACTORS = []
+
+
+def register_extractor(extractor_class):
+    """
+    Class decorator that adds an extractor to the layout detection order
+
+    Args:
+        extractor_class (type): BlogExtractor subclass
+
+    Returns:
+        type: the same class
+    """
+    EXTRACTORS.append(extractor_class())
+    return extractor_class
+
+
+class BlogExtractor(ABC):
+    """
+    Base class for parsing one blog page layout
+    """
+    name = None
+
+    @abstractmethod
+    def detect(self, soup=BeautifulSoup) -> bool:
+        """
+        Checks a few marker nodes to see if a page uses this layout
+
+        Args:
+            soup (BeautifulSoup): soup of the website
+
+        Returns:
+            bool: True if this extractor can parse the page
+        """
+
+    @abstractmethod
+    def get_blog_dict(self, blog_post: BlogPost, soup=BeautifulSoup) -> dict:
+        """
+        Returns the blog dict
+
+        Args:
+            blog_post (BlogPost): BlogPost object the page was fetched with
+            soup (BeautifulSoup): soup of the website
+
+        Raises:
+            UnsupportedLayoutError: if the page does not match this layout
+
+        Returns:
+            dict: blog attributes as a dict
+        """
+
+    def get_blog_body(self, soup=BeautifulSoup) -> str:
+        """
+        GETS the body of a blog post
+
         Args:
             soup (BeautifulSoup): soup of the website
 
@@ -89,42 +331,27 @@ class BlogPost:
             div.decompose()
         return soup.article.get_text().strip()
 
-    def get_blog_dict(self, soup=BeautifulSoup) -> dict:
+    @staticmethod
+    def get_aws_tags(blog_post: BlogPost, soup: BeautifulSoup, blog_title: str) -> list:
         """
-        Returns the blog dict
-        
+        GETS the aws service tags of a post from its categories, title and tag list
+
+        Args:
+            blog_post (BlogPost): BlogPost object the page was fetched with
+            soup (BeautifulSoup): soup of the website
+            blog_title (str): title of the post
+
         Returns:
-            dict: blog attributes as a dict
+            list: list of tags or None
         """
-        authors = []
         blog_tags = []
-        try:
-            category = soup.find("h2", {"class": "lb-h5 blog-title"}).get_text().strip()
-            # Get Blog Post title
-            blog_title = soup.find("h1", {"class": "lb-h2 blog-post-title"}).get_text().strip()
-            # Get authors from post
-            for author in soup.find_all("h3", {"class": "lb-h4"}):
-                if author:
-                    authors.append(author.get_text().strip().lower())
-            for author in soup.find_all("span", {"property": "author"}):
-                if author:
-                    if author not in authors:
-                        authors.append(author.get_text().strip().lower())
-        except AttributeError:
-            sys.exit("Blog posts are older than supported by this tool currently.")
-
-        # Get Published date
-        pub_date_str = soup.find("time", {"property": "datePublished"}).get_text().strip()
-        # Convert Published date to datetime object
-        date_obj = datetime.strptime(pub_date_str, "%d %b %Y")
-        published_date = date_obj.strftime("%Y-%m-%d")
         try:
             # Get tags from post
             blog_title_tags = soup.find("span",
                                         {"class": "blog-post-categories"}
                                         ).get_text().strip().lower() + \
                                         f", {blog_title.lower()}"
-            aws_tags = self.get_tags(blog_title_tags)
+            aws_tags = blog_post.get_tags(blog_title_tags)
             # Get all tags and add them to list
             for div in soup.find_all("div", {"class":"blog-tag-list"}):
                 if "TAGS: " in div.get_text().strip():
@@ -137,31 +364,163 @@ class BlogPost:
                         aws_tags.append(tag.lower())
         except AttributeError:
             aws_tags = None
+        return aws_tags
+
+
+@register_extractor
+class CurrentLayoutExtractor(BlogExtractor):
+    """
+    Extractor for the blog layout used since 2017
+    """
+    name = "current"
+
+    def detect(self, soup=BeautifulSoup) -> bool:
+        return soup.find("h1", {"class": "lb-h2 blog-post-title"}) is not None and \
+            soup.find("h2", {"class": "lb-h5 blog-title"}) is not None
+
+    def get_blog_dict(self, blog_post: BlogPost, soup=BeautifulSoup) -> dict:
+        authors = []
+        try:
+            category = soup.find("h2", {"class": "lb-h5 blog-title"}).get_text().strip()
+            # Get Blog Post title
+            blog_title = soup.find("h1", {"class": "lb-h2 blog-post-title"}).get_text().strip()
+            # Get authors from post
+            for author in soup.find_all("h3", {"class": "lb-h4"}):
+                if author:
+                    authors.append(author.get_text().strip().lower())
+            for author in soup.find_all("span", {"property": "author"}):
+                if author:
+                    if author not in authors:
+                        authors.append(author.get_text().strip().lower())
+            # Get Published date
+            pub_date_str = soup.find("time", {"property": "datePublished"}).get_text().strip()
+        except AttributeError as e:
+            raise UnsupportedLayoutError(
+                f"{blog_post.url} does not match the {self.name} layout."
+            ) from e
+
+        # Convert Published date to datetime object
+        date_obj = datetime.strptime(pub_date_str, "%d %b %Y")
+        published_date = date_obj.strftime("%Y-%m-%d")
+        aws_tags = self.get_aws_tags(blog_post, soup, blog_title)
         post_data = {
                 'category': category.lower(),
                 'blog_title': blog_title.lower(),
                 'authors': list(set(authors)),
                 'date_published': published_date,
                 'tags': list(set(aws_tags)) if aws_tags else None,
-                'url': self.url
+                'url': blog_post.url
             }
         return post_data
 
-    ## Get tags from text file.
-    def get_tags(self, blog_title_tags: list) -> list:
-        """
-        GETS list of blog tags
-        
-        Args:
-            blog_title_tags (list): list of tags from blog title
 
-        Returns:
-            list: list of tags
+@register_extractor
+class LegacyLayoutExtractor(BlogExtractor):
+    """
+    Extractor for posts older than 2017
+
+    These pages are missing the lb-* classes, so each field falls back
+    through the older markup and the page meta tags. A page must have a
+    post title or post body marker, so listing and tag pages that only
+    have a heading and a date are not taken for posts.
+    """
+    name = "legacy"
+    # Attributes of the div or section holding the post body
+    BODY_MARKERS = ({"class": "entry-content"}, {"class": "post-body"},
+                    {"property": "articleBody"})
+
+    def detect(self, soup=BeautifulSoup) -> bool:
+        return self._has_marker(soup) and self._get_title(soup) is not None and \
+            self._get_date(soup) is not None
+
+    def get_blog_dict(self, blog_post: BlogPost, soup=BeautifulSoup) -> dict:
+        blog_title = self._get_title(soup)
+        published_date = self._get_date(soup)
+        if not self._has_marker(soup) or blog_title is None or published_date is None:
+            raise UnsupportedLayoutError(
+                f"{blog_post.url} does not match the {self.name} layout."
+            )
+        category = self._get_category(soup, blog_post.url)
+        authors = []
+        for author in soup.find_all(["span", "a"], {"property": "author"}) + \
+                soup.find_all("a", {"rel": "author"}):
+            authors.append(author.get_text().strip().lower())
+        if not authors:
+            meta = soup.find("meta", {"name": "author"})
+            if meta and meta.get("content"):
+                authors.append(meta["content"].strip().lower())
+        aws_tags = self.get_aws_tags(blog_post, soup, blog_title)
+        if aws_tags is None:
+            aws_tags = blog_post.get_tags(f"{category.lower()}, {blog_title.lower()}")
+        post_data = {
+                'category': category.lower(),
+                'blog_title': blog_title.lower(),
+                'authors': list(set(authors)),
+                'date_published': published_date,
+                'tags': list(set(aws_tags)) if aws_tags else None,
+                'url': blog_post.url
+            }
+        return post_data
+
+    def get_blog_body(self, soup=BeautifulSoup) -> str:
+        if soup.article is not None:
+            return super().get_blog_body(soup)
+        for attrs in self.BODY_MARKERS:
+            div = soup.find(["div", "section"], attrs)
+            if div is not None:
+                return div.get_text().strip()
+        raise UnsupportedLayoutError("Could not find the body of the post.")
+
+    @classmethod
+    def _has_marker(cls, soup: BeautifulSoup) -> bool:
         """
-        tags = []
-        with open('aws_services.txt', encoding="utf-8") as f:
-            lines = [line.rstrip().lower() for line in f]
-            for tag in lines:
-                if tag in blog_title_tags:
-                    tags.append(tag.lower())
-            return tags
+        Checks for the post title or a post body container
+        """
+        if soup.find("h1", {"class": "blog-post-title"}) is not None:
+            return True
+        return any(soup.find(["div", "section"], attrs) is not None
+                   for attrs in cls.BODY_MARKERS)
+
+    @staticmethod
+    def _get_title(soup: BeautifulSoup) -> str:
+        title = soup.find("h1", {"class": "blog-post-title"}) or \
+            soup.find("h1", {"property": "name headline"})
+        if title is not None and title.get_text().strip():
+            return title.get_text().strip()
+        meta = soup.find("meta", {"property": "og:title"})
+        if meta and meta.get("content"):
+            return meta["content"].strip()
+        return None
+
+    @staticmethod
+    def _get_date(soup: BeautifulSoup) -> str:
+        time_tag = soup.find("time", {"property": "datePublished"})
+        if time_tag is not None:
+            try:
+                return datetime.strptime(time_tag.get_text().strip(),
+                                         "%d %b %Y").strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        candidates = [tag.get("datetime") for tag in soup.find_all("time")]
+        meta = soup.find("meta", {"property": "article:published_time"})
+        if meta:
+            candidates.append(meta.get("content"))
+        for value in candidates:
+            if value and len(value) >= 10:
+                try:
+                    return datetime.strptime(value[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+                except ValueError:
+                    continue
+        return None
+
+    @staticmethod
+    def _get_category(soup: BeautifulSoup, url: str) -> str:
+        category = soup.find("h2", {"class": "blog-title"})
+        if category is not None and category.get_text().strip():
+            return category.get_text().strip()
+        meta = soup.find("meta", {"property": "og:site_name"})
+        if meta and meta.get("content"):
+            return meta["content"].strip()
+        # Fall back to the blog name in the url, ex: .../blogs/security/... -> security
+        section = BlogPost._section(url) or ""
+        return section.rsplit("/", 1)[-1].replace("-", " ")
@@ -0,0 +1,219 @@
+"""
+On-disk cache of raw blog page responses
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CacheWorker:
+    """
+    Class used to cache raw HTTP responses on disk, keyed by url
+
+    Page bodies are stored once per content hash and compressed with
+    zstd (zlib if zstandard is not installed). A small SQLite index maps
+    each url to its body and its ETag/Last-Modified validators, and
+    tracks last access so the cache can be trimmed least recently used
+    first.
+    """
+    def __init__(self, cache_dir: str=".blog_cache", max_size_mb: int=1024,
+                 offline: bool=False):
+        """
+        Method to initialize the class
+
+        Args:
+            cache_dir (str):        Directory to store the cache in
+            max_size_mb (int):      Maximum size of the stored bodies in megabytes
+            offline (bool):         If True, never touch the network
+
+        :Example:
+            cache = CacheWorker(cache_dir=".blog_cache", max_size_mb=512)
+            worker = BlogPost(cache=cache)
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.offline = offline
+        self.codec = "zst" if zstandard else "zz"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.db"),
+                                  check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+        """)
+        self.db.commit()
+
+    def _blob_path(self, digest: str, codec: str) -> str:
+        """
+        Returns the path of a stored body
+        """
+        return os.path.join(self.cache_dir, "objects", digest[:2], f"{digest}.{codec}")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zst":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return zlib.compress(data, 6)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zst":
+            if zstandard is None:
+                raise ImportError("zstandard is required to read this cache")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def get(self, url: str) -> str:
+        """
+        Returns the cached body of a url
+
+        Args:
+            url (str): url of the website
+
+        Returns:
+            str: cached page text, or None if the url is not cached
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT e.digest, b.codec FROM entries e JOIN blobs b USING (digest) "
+                "WHERE e.url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            digest, codec = row
+            try:
+                with open(self._blob_path(digest, codec), "rb") as f:
+                    data = self._decompress(f.read(), codec)
+            except FileNotFoundError:
+                # Body was removed from disk, drop the stale entry
+                self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE entries SET last_access = ? WHERE url = ?",
+                            (time.time(), url))
+            self.db.commit()
+        return data.decode("utf-8")
+
+    def validators(self, url: str) -> dict:
+        """
+        Returns conditional request headers for a cached url
+
+        Args:
+            url (str): url of the website
+
+        Returns:
+            dict: If-None-Match/If-Modified-Since headers, empty if not cached
+        """
+        with self._lock:
+            row = self.db.execute("SELECT etag, last_modified FROM entries WHERE url = ?",
+                                  (url,)).fetchone()
+        headers = {}
+        if row:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def put(self, url: str, text: str, etag: str=None, last_modified: str=None):
+        """
+        Stores the body of a url and evicts old entries if over max size
+
+        Args:
+            url (str):                      url of the website
+            text (str):                     page text
+            etag (str) Optional:            ETag response header
+            last_modified (str) Optional:   Last-Modified response header
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            previous = self.db.execute("SELECT digest FROM entries WHERE url = ?",
+                                       (url,)).fetchone()
+            row = self.db.execute("SELECT codec FROM blobs WHERE digest = ?",
+                                  (digest,)).fetchone()
+            if row is None or not os.path.exists(self._blob_path(digest, row[0])):
+                compressed = self._compress(data)
+                path = self._blob_path(digest, self.codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so a crash never leaves a partial body
+                with open(path + ".tmp", "wb") as f:
+                    f.write(compressed)
+                os.replace(path + ".tmp", path)
+                self.db.execute("INSERT OR REPLACE INTO blobs (digest, codec, size) "
+                                "VALUES (?, ?, ?)", (digest, self.codec, len(compressed)))
+            self.db.execute("INSERT OR REPLACE INTO entries "
+                            "(url, digest, etag, last_modified, last_access) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (url, digest, etag, last_modified, time.time()))
+            if previous and previous[0] != digest:
+                self._remove_blob_if_unused(previous[0])
+            self._evict()
+            self.db.commit()
+
+    def size(self) -> int:
+        """
+        Returns the total size in bytes of the stored bodies
+        """
+        with self._lock:
+            return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _remove_blob_if_unused(self, digest: str) -> int:
+        """
+        Deletes a body if no url points to it anymore
+
+        Returns:
+            int: number of bytes freed
+        """
+        if self.db.execute("SELECT 1 FROM entries WHERE digest = ?", (digest,)).fetchone():
+            return 0
+        row = self.db.execute("SELECT codec, size FROM blobs WHERE digest = ?",
+                              (digest,)).fetchone()
+        if row is None:
+            return 0
+        try:
+            os.remove(self._blob_path(digest, row[0]))
+        except FileNotFoundError:
+            pass
+        self.db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        return row[1]
+
+    def _evict(self):
+        """
+        Drops least recently used urls until the cache is under max size
+        """
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for url, digest in self.db.execute(
+                "SELECT url, digest FROM entries ORDER BY last_access").fetchall():
+            self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            total -= self._remove_blob_if_unused(digest)
+            if total <= self.max_size:
+                break
+
+    def close(self):
+        """
+        Closes the cache index
+        """
+        with self._lock:
+            self.db.close()
@@ -0,0 +1,212 @@
+"""
+Records the S3 keys added, updated and deleted during a run
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+ADDED = "added"
+UPDATED = "updated"
+DELETED = "deleted"
+JOURNAL_SUFFIX = ".journal"
+
+
+class ChangeLogWorker:
+    """
+    Class used to collect S3 changes and save them as a manifest per run
+
+    A manifest is a compact JSON file named after the run id, ex:
+    manifests/20240101T120000123456Z-1a2b3c4d.json
+    {"run_id": ..., "bucket": ..., "changes": {"key.txt": ["added", "<sha256>"]}}
+    The run id is taken when the manifest is saved, plus a random suffix,
+    so names sort in the order the manifests were written. Runs can
+    overlap, so a reader must track which manifests it consumed by name
+    and not assume that nothing sorts before the last one it read. A key
+    changed by two overlapping runs ends up with the change of the run
+    that saved last.
+
+    Each change is also appended to a journal file as soon as it is
+    recorded, so a run that is killed before it saves its manifest does
+    not lose track of objects it already wrote. recover() turns the
+    journals of dead runs into manifests. A live run keeps its journal
+    locked, so only journals nobody holds are recovered (POSIX only).
+    """
+    def __init__(self, manifest_dir: str="manifests", bucket: str=None):
+        """
+        Method to initialize the class
+
+        Args:
+            manifest_dir (str):         Directory manifests are saved in
+            bucket (str) Optional:      Name of the bucket the keys belong to
+        """
+        self.manifest_dir = manifest_dir
+        self.bucket = bucket
+        # Set when the manifest is saved
+        self.run_id = None
+        self.changes = {}
+        self._journal = None
+        self._journal_path = None
+        self._lock = threading.Lock()
+
+    def record(self, key: str, action: str, content_hash: str=None):
+        """
+        Records a change to a key
+
+        A key added and then updated in the same run stays "added".
+
+        Args:
+            key (str):                  S3 key that changed
+            action (str):               "added", "updated" or "deleted"
+            content_hash (str) Optional: SHA-256 of the new content
+        """
+        with self._lock:
+            self._apply(self.changes, key, action, content_hash)
+            if self._journal is None:
+                self._open_journal()
+            self._journal.write(json.dumps([key, action, content_hash]) + "\n")
+            self._journal.flush()
+            # On disk before the sink drops the record from its write-ahead log
+            os.fsync(self._journal.fileno())
+
+    @staticmethod
+    def _apply(changes: dict, key: str, action: str, content_hash: str):
+        previous = changes.get(key)
+        if previous and previous[0] == ADDED and action == UPDATED:
+            action = ADDED
+        changes[key] = [action, content_hash]
+
+    def _open_journal(self):
+        """
+        Creates and locks the journal of this run
+
+        The journal gets its final name only once it is locked, so
+        recover() never sees it unlocked while this run is alive.
+        """
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = os.path.join(self.manifest_dir, f"{uuid.uuid4().hex}{JOURNAL_SUFFIX}")
+        journal = open(path + ".tmp", "a", encoding="utf-8")
+        if fcntl is not None:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+        journal.write(json.dumps({"bucket": self.bucket}) + "\n")
+        os.replace(path + ".tmp", path)
+        self._journal = journal
+        self._journal_path = path
+
+    def save(self) -> str:
+        """
+        Writes the manifest for this run if anything changed
+
+        Returns:
+            str: path of the manifest, or None if nothing changed
+        """
+        with self._lock:
+            if not self.changes:
+                return None
+            path = self._write_manifest(self.manifest_dir, self.bucket, self.changes)
+            self.run_id = os.path.basename(path)[:-5]
+            if self._journal is not None:
+                # The manifest has every change, the journal is not needed anymore
+                os.remove(self._journal_path)
+                self._journal.close()
+                self._journal = None
+        print(f"Wrote {len(self.changes)} changes to {path}")
+        return path
+
+    @staticmethod
+    def _write_manifest(manifest_dir: str, bucket: str, changes: dict) -> str:
+        run_id = (f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-"
+                  f"{uuid.uuid4().hex[:8]}")
+        manifest = {
+            "run_id": run_id,
+            "bucket": bucket,
+            "changes": changes,
+        }
+        os.makedirs(manifest_dir, exist_ok=True)
+        path = os.path.join(manifest_dir, f"{run_id}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        return path
+
+    @staticmethod
+    def recover(manifest_dir: str) -> list:
+        """
+        Saves the journals of runs that died before writing their manifest
+
+        A journal that a live run still holds is left alone. Does
+        nothing where file locks are not available.
+
+        Args:
+            manifest_dir (str):         Directory manifests are saved in
+
+        Returns:
+            list: paths of the manifests written
+        """
+        if fcntl is None or not os.path.isdir(manifest_dir):
+            return []
+        paths = []
+        for name in sorted(os.listdir(manifest_dir)):
+            if not name.endswith(JOURNAL_SUFFIX):
+                continue
+            path = os.path.join(manifest_dir, name)
+            try:
+                journal = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Its run is still going
+                    continue
+                if os.fstat(journal.fileno()).st_nlink == 0:
+                    # Saved or recovered by someone else while we waited
+                    continue
+                bucket = None
+                changes = {}
+                for i, line in enumerate(journal):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line of a killed run may be cut short
+                        continue
+                    if i == 0 and isinstance(entry, dict):
+                        bucket = entry.get("bucket")
+                    elif isinstance(entry, list) and len(entry) == 3:
+                        ChangeLogWorker._apply(changes, *entry)
+                if changes:
+                    paths.append(ChangeLogWorker._write_manifest(manifest_dir, bucket, changes))
+                    print(f"Recovered {len(changes)} changes from {path} to {paths[-1]}")
+                os.remove(path)
+        return paths
+
+    @staticmethod
+    def load_manifests(manifest_dir: str, skip: set=None) -> list:
+        """
+        Loads the manifests that were not consumed yet, in the order they were saved
+
+        Args:
+            manifest_dir (str):         Directory manifests are saved in
+            skip (set) Optional:        File names of manifests already consumed
+
+        Returns:
+            list: (file name, manifest dict) tuples
+        """
+        if not os.path.isdir(manifest_dir):
+            return []
+        skip = skip or set()
+        manifests = []
+        for name in sorted(os.listdir(manifest_dir)):
+            if not name.endswith(".json") or name in skip:
+                continue
+            with open(os.path.join(manifest_dir, name), encoding="utf-8") as f:
+                manifests.append((name, json.load(f)))
+        return manifests
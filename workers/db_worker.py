@@ -1,9 +1,12 @@
+import os
 import boto3
 import logging
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key, Attr
+from workers.error_worker import retry_with_backoff
 
 # Setup logging
+os.makedirs('./logs', exist_ok=True)
 logging.basicConfig(filename='./logs/app.log', filemode='a', format='%(asctime)s - - %(module)s - %(levelname)s - %(message)s', level=logging.INFO)
 
 class DynamoDBWorker:
@@ -78,6 +81,93 @@ class DynamoDBWorker:
             logging.error(f"Could not post item. Error: {e}")
         
 
+    def post_record(self, record):
+        """
+        Method to post the metadata of a BlogRecord to the DynamoDB table.
+
+        Args:
+            record (BlogRecord):    The blog post to post.
+
+        """
+        self.post_item(record.metadata())
+
+    def post_records(self, records: list) -> list:
+        """
+        Method to post the metadata of many BlogRecords.
+
+        Each item is written with update_item, which creates it if it is
+        missing and only SETs the metadata attributes. The enrichment
+        attributes of an existing item are never read or overwritten, so
+        a summary written by another worker at the same time is kept.
+
+        Args:
+            records (list):         The BlogRecords to post.
+
+        Returns:
+            list: (record, exception) tuples for records that failed
+        """
+        failed = []
+        for record in records:
+            try:
+                retry_with_backoff(self._update_metadata, record)
+            except Exception as e:
+                logging.error(f"Could not post item {record.s3_key}. Error: {e}")
+                failed.append((record, e))
+        logging.info(f"Posted {len(records) - len(failed)} items to {self.table_name}.")
+        return failed
+
+    def _update_metadata(self, record):
+        item = record.metadata()
+        key = {'blog_title': item.pop('blog_title'),
+               'date_published': item.pop('date_published')}
+        # Placeholders for every name, some (ex: url) are reserved words
+        names = {f'#a{i}': name for i, name in enumerate(item)}
+        values = {f':v{i}': value for i, value in enumerate(item.values())}
+        self.table.update_item(
+            Key=key,
+            UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(item))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+    def get_enriched_hash(self, record) -> str:
+        """
+        Method to get the content hash a post was last enriched at.
+
+        Args:
+            record (BlogRecord):    The blog post.
+
+        Returns:
+            str: content hash, or None if the post was not enriched
+        """
+        try:
+            response = self.table.get_item(
+                Key={'blog_title': record.blog_title, 'date_published': record.date_published},
+                ProjectionExpression='enriched_hash'
+            )
+            return response.get('Item', {}).get('enriched_hash')
+        except ClientError as e:
+            logging.error(f"Could not get item. Error: {e}")
+            return None
+
+    def update_enrichment(self, record, summary: str, service_tags: list):
+        """
+        Method to set the summary and service tags of a post.
+
+        Args:
+            record (BlogRecord):    The blog post.
+            summary (str):          Summary of the post.
+            service_tags (list):    AWS services the post covers.
+        """
+        retry_with_backoff(
+            self.table.update_item,
+            Key={'blog_title': record.blog_title, 'date_published': record.date_published},
+            UpdateExpression='SET summary = :s, service_tags = :t, enriched_hash = :h',
+            ExpressionAttributeValues={
+                ':s': summary, ':t': service_tags, ':h': record.content_hash
+            }
+        )
+
     def search_items(self, attribute, value, index_name=None):
         try:
             if index_name:
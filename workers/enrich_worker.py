@@ -0,0 +1,242 @@
+"""
+Adds LLM summaries and AWS service tags to blog posts in batches
+"""
+import json
+import re
+import threading
+from workers.bedrock_worker import SUPPORTED_MODELS
+
+
+# Rough size of a token in characters, used to pack posts into a request
+CHARS_PER_TOKEN = 4
+# Output tokens reserved for the result of each post in a request
+OUTPUT_TOKENS_PER_POST = 250
+PROMPT_TEMPLATE = """Below are {count} AWS blog posts, each in a <post id="N"> tag.
+For each post write a summary of 2-3 sentences and list the AWS services it covers, using official AWS service names.
+Reply with only a JSON array with one object per post, in this form:
+[{{"id": 0, "summary": "...", "services": ["Amazon S3", "AWS Lambda"]}}]
+
+{posts}"""
+
+
+class EnrichWorker:
+    """
+    Class used to summarize and tag blog posts with Amazon Bedrock
+
+    Several posts are packed into each request, up to a token budget.
+    Results are stored in S3 under enrichment/<content_hash>.json and,
+    if a DynamoDB worker is given, on the post's item. A post whose
+    content hash was already enriched is skipped.
+    """
+    def __init__(self, bedrock, s3=None, db=None, model_id: str="anthropic.claude-v2",
+                 token_budget: int=8000, max_posts_per_request: int=8,
+                 max_chars_per_post: int=6000, prefix: str="enrichment/"):
+        """
+        Method to initialize the class
+
+        Args:
+            bedrock (BedrockWorker):            BedrockWorker object
+            s3 (S3Worker) Optional:             S3Worker to store results in
+            db (DynamoDBWorker) Optional:       DynamoDBWorker to store results in
+            model_id (str):                     The ID of the model to use
+            token_budget (int):                 Most input and output tokens per request
+            max_posts_per_request (int):        Most posts packed into one request
+            max_chars_per_post (int):           Post bodies are cut to this length
+            prefix (str):                       S3 prefix of the stored results
+
+        :Example:
+            enrich = EnrichWorker(BedrockWorker(), s3=s3)
+            failed = enrich.enrich_records(records)
+        """
+        if s3 is None and db is None:
+            raise ValueError("s3 or db is required to store results.")
+        if model_id not in SUPPORTED_MODELS:
+            raise ValueError(f"Model {model_id} is not supported. "
+                             f"Use one of: {', '.join(SUPPORTED_MODELS)}")
+        self.bedrock = bedrock
+        self.s3 = s3
+        self.db = db
+        self.model_id = model_id
+        self.token_budget = token_budget
+        self.max_posts_per_request = max_posts_per_request
+        self.max_chars_per_post = max_chars_per_post
+        self.prefix = prefix
+        self.requests = 0
+        self._enriched = set()
+        self._lock = threading.Lock()
+
+    def result_key(self, record) -> str:
+        """
+        Returns the S3 key of a post's enrichment result
+        """
+        return f"{self.prefix}{record.content_hash}.json"
+
+    def is_enriched(self, record) -> bool:
+        """
+        Checks if a post with the same content was already enriched
+
+        Args:
+            record (BlogRecord): the blog post
+
+        Returns:
+            bool: True if a result exists for the record's content hash
+        """
+        if record.content_hash in self._enriched:
+            return True
+        if self.s3 is not None:
+            enriched = self.s3.object_exists(self.result_key(record))
+        else:
+            enriched = self.db.get_enriched_hash(record) == record.content_hash
+        if enriched:
+            with self._lock:
+                self._enriched.add(record.content_hash)
+        return bool(enriched)
+
+    def _post_text(self, record) -> str:
+        return f"{record.blog_title}\n{record.body[:self.max_chars_per_post]}"
+
+    def _cost(self, record) -> int:
+        """
+        Estimates the input and output tokens a post adds to a request
+        """
+        return len(self._post_text(record)) // CHARS_PER_TOKEN + OUTPUT_TOKENS_PER_POST
+
+    def make_batches(self, records: list) -> list:
+        """
+        Packs posts into requests without going over the token budget
+
+        Args:
+            records (list): the blog posts
+
+        Returns:
+            list: list of lists of BlogRecords, one per request
+        """
+        prompt_tokens = len(PROMPT_TEMPLATE) // CHARS_PER_TOKEN
+        batches = []
+        batch = []
+        used = prompt_tokens
+        # Largest first so the small posts fill the gaps
+        for record in sorted(records, key=self._cost, reverse=True):
+            cost = self._cost(record)
+            if batch and (used + cost > self.token_budget or
+                          len(batch) >= self.max_posts_per_request):
+                batches.append(batch)
+                batch = []
+                used = prompt_tokens
+            batch.append(record)
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def build_prompt(self, batch: list) -> str:
+        """
+        Returns the prompt for one request
+
+        Args:
+            batch (list): the blog posts in the request
+
+        Returns:
+            str: prompt text
+        """
+        posts = "\n\n".join(f'<post id="{i}">\n{self._post_text(record)}\n</post>'
+                            for i, record in enumerate(batch))
+        return PROMPT_TEMPLATE.format(count=len(batch), posts=posts)
+
+    @staticmethod
+    def parse_response(text: str, count: int) -> dict:
+        """
+        Parses the JSON array in a model response
+
+        Args:
+            text (str):     model response
+            count (int):    number of posts in the request
+
+        Raises:
+            ValueError: if the response has no JSON array
+
+        Returns:
+            dict: post id to {"summary": str, "services": list}
+        """
+        match = re.search(r"\[.*\]", text, re.DOTALL)
+        if match is None:
+            raise ValueError("Model response has no JSON array.")
+        results = {}
+        for item in json.loads(match.group()):
+            if not isinstance(item, dict):
+                continue
+            try:
+                post_id = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= post_id < count and isinstance(item.get("summary"), str):
+                services = item.get("services") or []
+                results[post_id] = {
+                    "summary": item["summary"].strip(),
+                    "services": sorted({str(s).strip().lower() for s in services if s}),
+                }
+        return results
+
+    def store(self, record, result: dict):
+        """
+        Stores the result of a post in S3 and DynamoDB
+
+        Args:
+            record (BlogRecord):    the blog post
+            result (dict):          {"summary": str, "services": list}
+        """
+        if self.db is not None:
+            self.db.update_enrichment(record, result["summary"], result["services"])
+        if self.s3 is not None:
+            data = json.dumps({
+                "s3_key": record.s3_key,
+                "url": record.url,
+                "content_hash": record.content_hash,
+                "model_id": self.model_id,
+                "summary": result["summary"],
+                "service_tags": result["services"],
+            }, separators=(",", ":"))
+            # Results are not blog posts, keep them out of the knowledge base sync
+            self.s3.write_file_directly_to_s3(self.result_key(record), data,
+                                              track_change=False)
+        with self._lock:
+            self._enriched.add(record.content_hash)
+
+    def enrich_records(self, records: list) -> list:
+        """
+        Summarizes and tags the posts that were not enriched yet
+
+        Args:
+            records (list): the blog posts
+
+        Returns:
+            list: (record, exception) tuples for records that failed
+        """
+        todo = {}
+        for record in records:
+            # Posts with the same body share one result
+            if record.content_hash not in todo and not self.is_enriched(record):
+                todo[record.content_hash] = record
+        failed = []
+        for batch in self.make_batches(list(todo.values())):
+            try:
+                response = self.bedrock.prompt(
+                    self.build_prompt(batch), model_id=self.model_id,
+                    temperature=0, maxTokenCount=OUTPUT_TOKENS_PER_POST * len(batch))
+                self.requests += 1
+                results = self.parse_response(response["response"], len(batch))
+            except Exception as e:
+                failed.extend((record, e) for record in batch)
+                continue
+            for i, record in enumerate(batch):
+                if i not in results:
+                    failed.append((record, ValueError("Model response is missing this post.")))
+                    continue
+                try:
+                    self.store(record, results[i])
+                except Exception as e:
+                    failed.append((record, e))
+        # Report every copy of a failed body, not only the one that was sent
+        failed_hashes = {record.content_hash: e for record, e in failed}
+        return [(record, failed_hashes[record.content_hash]) for record in records
+                if record.content_hash in failed_hashes]
@@ -0,0 +1,226 @@
+"""
+Per-item error handling: retries with backoff and a dead-letter file
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+import requests
+from botocore.exceptions import (ClientError, ConnectionClosedError,
+                                 EndpointConnectionError, ReadTimeoutError)
+
+
+# HTTP status codes that are worth retrying
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# AWS error codes that are worth retrying
+TRANSIENT_AWS_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "InternalError",
+    "InternalServerException",
+    "SlowDown",
+}
+
+
+class TransientError(Exception):
+    """
+    Raised for failures that may succeed if retried (ex: HTTP 503)
+    """
+
+
+class UnsupportedLayoutError(Exception):
+    """
+    Raised when a blog page does not match a layout the tool can parse
+    """
+
+
+class WALInUseError(Exception):
+    """
+    Raised when another process is using a write-ahead log
+    """
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Checks if an exception is a transient HTTP or AWS error
+
+    Args:
+        error (Exception): exception to check
+
+    Returns:
+        bool: True if the call that raised it should be retried
+    """
+    if isinstance(error, TransientError):
+        return True
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in TRANSIENT_AWS_ERROR_CODES
+    return False
+
+
+def retry_with_backoff(func, *args, attempts: int=4, base_delay: float=1.0,
+                       max_delay: float=30.0, **kwargs):
+    """
+    Calls a function and retries transient errors with exponential backoff
+
+    Non-transient errors are raised right away so a bad item only
+    costs a single call.
+
+    Args:
+        func (callable):        function to call
+        attempts (int):         total number of calls before giving up
+        base_delay (float):     delay in seconds before the first retry
+        max_delay (float):      upper bound for a single delay in seconds
+
+    Returns:
+        The return value of func
+
+    :Example:
+        retry_with_backoff(requests.get, url, timeout=10)
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            # Full jitter keeps parallel callers from retrying in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            print(f"Transient error: {e}. Retrying in {delay:.1f}s ({attempt}/{attempts - 1})")
+            time.sleep(delay)
+
+
+class ErrorWorker:
+    """
+    Class used to record failed items and report on a run
+    """
+    def __init__(self, dead_letter_file: str="dead_letter.jsonl"):
+        """
+        Method to initialize the class
+
+        Args:
+            dead_letter_file (str):     Path of the file failed items are appended to
+
+        Attributes:
+            succeeded (int):            Number of items processed successfully
+            failed (list):              List of failed item dicts
+            warnings (list):            List of dicts for optional steps that failed
+                                        on items that still succeeded
+        """
+        self.dead_letter_file = dead_letter_file
+        self.succeeded = 0
+        self.failed = []
+        self.warnings = []
+        # Sinks record failures from their own threads
+        self._lock = threading.Lock()
+
+    def record_success(self, count: int=1):
+        """
+        Counts items that were processed successfully
+
+        Args:
+            count (int): number of items
+        """
+        with self._lock:
+            self.succeeded += count
+
+    def record_failure(self, url: str, error: Exception, stage: str=None) -> dict:
+        """
+        Appends a failed item to the dead-letter file
+
+        Args:
+            url (str):              url of the item that failed
+            error (Exception):      exception that was raised
+            stage (str) Optional:   name of the step that failed (ex: "parse")
+
+        Returns:
+            dict: the dead-letter entry
+        """
+        entry = {
+            "url": url,
+            "stage": stage,
+            "error_type": type(error).__name__,
+            "reason": str(error),
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self.failed.append(entry)
+            with open(self.dead_letter_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        print(f"Failed: {url} ({entry['error_type']}: {entry['reason']})")
+        return entry
+
+    def record_warning(self, url: str, error: Exception, stage: str=None) -> dict:
+        """
+        Records a failed optional step (ex: "enrich") on an item that succeeded
+
+        Warnings are reported but not counted as failures or written to
+        the dead-letter file, since the item does not need to be redone.
+
+        Args:
+            url (str):              url of the item
+            error (Exception):      exception that was raised
+            stage (str) Optional:   name of the step that failed
+
+        Returns:
+            dict: the warning entry
+        """
+        entry = {
+            "url": url,
+            "stage": stage,
+            "error_type": type(error).__name__,
+            "reason": str(error),
+        }
+        with self._lock:
+            self.warnings.append(entry)
+        print(f"Warning: {stage} failed for {url} ({entry['error_type']}: {entry['reason']})")
+        return entry
+
+    def report(self) -> dict:
+        """
+        Prints and returns a summary of the run
+
+        Returns:
+            dict: counts of succeeded and failed items, failures by stage and
+                  error type, and warnings by stage
+        """
+        by_type = {}
+        by_stage = {}
+        warnings_by_stage = {}
+        for entry in self.warnings:
+            warnings_by_stage[entry["stage"]] = warnings_by_stage.get(entry["stage"], 0) + 1
+        for entry in self.failed:
+            by_type[entry["error_type"]] = by_type.get(entry["error_type"], 0) + 1
+            by_stage[entry["stage"]] = by_stage.get(entry["stage"], 0) + 1
+        summary = {
+            "succeeded": self.succeeded,
+            "failed": len(self.failed),
+            "failures_by_stage": by_stage,
+            "failures_by_type": by_type,
+            "warnings": len(self.warnings),
+            "warnings_by_stage": warnings_by_stage,
+            "dead_letter_file": self.dead_letter_file if self.failed else None,
+        }
+        print(f"Succeeded: {summary['succeeded']}\nFailed: {summary['failed']}")
+        for stage, count in by_stage.items():
+            print(f"  {stage}: {count}")
+        for error_type, count in by_type.items():
+            print(f"  {error_type}: {count}")
+        if self.warnings:
+            print(f"Warnings: {summary['warnings']}")
+            for stage, count in warnings_by_stage.items():
+                print(f"  {stage}: {count}")
+        if self.failed:
+            print(f"Failed urls written to {self.dead_letter_file}")
+        return summary
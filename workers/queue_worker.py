@@ -0,0 +1,279 @@
+"""
+Shared work queues of blog post urls for distributed crawls
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+import boto3
+from workers.error_worker import is_transient, retry_with_backoff
+
+
+class WorkQueue(ABC):
+    """
+    Base class for a queue of urls that workers lease, process and ack
+
+    A leased url is hidden from other workers for the visibility
+    timeout. If it is not acked in that time it becomes visible again
+    and another worker picks it up, so a worker that dies loses nothing.
+    """
+    def __init__(self):
+        # url to receipt and receive count of the lease this worker holds
+        self.receipts = {}
+        self.receive_counts = {}
+        self._receipts_lock = threading.Lock()
+
+    @abstractmethod
+    def enqueue(self, urls: list) -> int:
+        """
+        Adds urls to the queue
+
+        Args:
+            urls (list): blog post urls
+
+        Returns:
+            int: number of urls sent
+        """
+
+    @abstractmethod
+    def lease(self, max_items: int=10, visibility_timeout: int=300) -> list:
+        """
+        Leases urls from the queue
+
+        Args:
+            max_items (int):            Most urls to lease
+            visibility_timeout (int):   Seconds the urls are hidden from other workers
+
+        Returns:
+            list: (url, receive_count) tuples
+        """
+
+    @abstractmethod
+    def ack(self, url: str):
+        """
+        Removes a leased url from the queue once it is done
+
+        Args:
+            url (str): blog post url
+        """
+
+    @abstractmethod
+    def release(self, url: str):
+        """
+        Makes a leased url visible again right away so it is retried
+
+        Args:
+            url (str): blog post url
+        """
+
+    def ack_records(self, records: list) -> list:
+        """
+        Acks the urls of BlogRecords, for use as a SinkWorker stage
+
+        Args:
+            records (list): BlogRecords that were written
+
+        Returns:
+            list: (record, exception) tuples for acks that failed
+        """
+        failed = []
+        for record in records:
+            try:
+                self.ack(record.url)
+            except Exception as e:
+                failed.append((record, e))
+        return failed
+
+    def release_records(self, failed: list, max_receives: int=5) -> list:
+        """
+        Releases the urls of BlogRecords that a sink failed to write
+
+        A transient failure is released for another worker to retry, up
+        to max_receives leases. Other failures are final and acked, and
+        the caller records them in the dead-letter file.
+
+        Args:
+            failed (list):          (record, exception) tuples
+            max_receives (int):     Leases of a url before a transient failure is final
+
+        Returns:
+            list: records that were released for a retry
+        """
+        released = []
+        for record, error in failed:
+            receive_count = self.receive_counts.get(record.url, max_receives)
+            try:
+                if is_transient(error) and receive_count < max_receives:
+                    print(f"Releasing {record.url} for retry "
+                          f"({receive_count}/{max_receives}). Error: {error}")
+                    self.release(record.url)
+                    released.append(record)
+                else:
+                    self.ack(record.url)
+            except Exception as e:
+                print(f"Could not release {record.url}. Error: {e}")
+        return released
+
+    def _hold(self, url: str, receipt: str, receive_count: int):
+        with self._receipts_lock:
+            self.receipts[url] = receipt
+            self.receive_counts[url] = receive_count
+
+    def _drop(self, url: str) -> str:
+        with self._receipts_lock:
+            self.receive_counts.pop(url, None)
+            return self.receipts.pop(url, None)
+
+
+class SQSQueue(WorkQueue):
+    """
+    Work queue on Amazon SQS
+    """
+    def __init__(self, queue_url: str, region_name: str="us-east-1"):
+        """
+        Method to initialize the class
+
+        Args:
+            queue_url (str):    URL of the SQS queue
+            region_name (str):  Name of the region
+        """
+        super().__init__()
+        self.sqs = boto3.client(service_name="sqs", region_name=region_name)
+        self.queue_url = queue_url
+
+    def enqueue(self, urls: list) -> int:
+        for start in range(0, len(urls), 10):
+            entries = [{"Id": str(i), "MessageBody": url}
+                       for i, url in enumerate(urls[start:start + 10])]
+            response = retry_with_backoff(self.sqs.send_message_batch,
+                                          QueueUrl=self.queue_url, Entries=entries)
+            for failure in response.get("Failed", []):
+                print(f"Could not enqueue {entries[int(failure['Id'])]['MessageBody']}. "
+                      f"Error: {failure.get('Message')}")
+        return len(urls)
+
+    def lease(self, max_items: int=10, visibility_timeout: int=300) -> list:
+        response = retry_with_backoff(
+            self.sqs.receive_message,
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_items, 10),
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=20,
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        leased = []
+        for message in response.get("Messages", []):
+            url = message["Body"]
+            receive_count = int(message["Attributes"]["ApproximateReceiveCount"])
+            self._hold(url, message["ReceiptHandle"], receive_count)
+            leased.append((url, receive_count))
+        return leased
+
+    def ack(self, url: str):
+        receipt = self._drop(url)
+        if receipt is not None:
+            retry_with_backoff(self.sqs.delete_message, QueueUrl=self.queue_url,
+                               ReceiptHandle=receipt)
+
+    def release(self, url: str):
+        receipt = self._drop(url)
+        if receipt is not None:
+            retry_with_backoff(self.sqs.change_message_visibility, QueueUrl=self.queue_url,
+                               ReceiptHandle=receipt, VisibilityTimeout=0)
+
+
+class SQLiteQueue(WorkQueue):
+    """
+    Work queue in a local SQLite file, a stand-in for SQS in tests
+
+    Several processes on one host can share the same file.
+    """
+    def __init__(self, path: str="work_queue.db", wait_seconds: float=5.0):
+        """
+        Method to initialize the class
+
+        Args:
+            path (str):             Path of the SQLite file
+            wait_seconds (float):   Seconds lease waits for a url, like SQS long polling
+        """
+        super().__init__()
+        self.path = path
+        self.wait_seconds = wait_seconds
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                url TEXT PRIMARY KEY,
+                visible_at REAL NOT NULL DEFAULT 0,
+                receipt TEXT,
+                receive_count INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS items_pending ON items (done, visible_at);
+        """)
+
+    def enqueue(self, urls: list) -> int:
+        with self._lock:
+            # A url already in the queue is not added twice
+            self.db.executemany("INSERT OR IGNORE INTO items (url) VALUES (?)",
+                                [(url,) for url in urls])
+        return len(urls)
+
+    def lease(self, max_items: int=10, visibility_timeout: int=300) -> list:
+        deadline = time.time() + self.wait_seconds
+        while True:
+            leased = self._lease(max_items, visibility_timeout)
+            if leased or time.time() >= deadline:
+                return leased
+            time.sleep(min(1.0, self.wait_seconds))
+
+    def _lease(self, max_items: int, visibility_timeout: int) -> list:
+        now = time.time()
+        leased = []
+        with self._lock:
+            # Locks the file so two workers never lease the same url
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute(
+                    "SELECT url, receive_count FROM items WHERE done = 0 AND visible_at <= ? "
+                    "ORDER BY visible_at LIMIT ?", (now, max_items)).fetchall()
+                for url, receive_count in rows:
+                    receipt = uuid.uuid4().hex
+                    self.db.execute(
+                        "UPDATE items SET visible_at = ?, receipt = ?, "
+                        "receive_count = receive_count + 1 WHERE url = ?",
+                        (now + visibility_timeout, receipt, url))
+                    self._hold(url, receipt, receive_count + 1)
+                    leased.append((url, receive_count + 1))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return leased
+
+    def ack(self, url: str):
+        receipt = self._drop(url)
+        if receipt is not None:
+            with self._lock:
+                # Only the current lease can ack, not one that already timed out
+                self.db.execute("UPDATE items SET done = 1 WHERE url = ? AND receipt = ?",
+                                (url, receipt))
+
+    def release(self, url: str):
+        receipt = self._drop(url)
+        if receipt is not None:
+            with self._lock:
+                self.db.execute("UPDATE items SET visible_at = 0 WHERE url = ? AND receipt = ?",
+                                (url, receipt))
+
+    def pending(self) -> int:
+        """
+        Returns the number of urls not acked yet
+        """
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM items WHERE done = 0").fetchone()[0]
@@ -3,24 +3,36 @@ This file is used to interact with S3.
 """
 import re
 import sys
+import hashlib
 import random
 import string
 import boto3
 from botocore.exceptions import ClientError, ParamValidationError
 from botocore import errorfactory
+from workers.change_worker import ADDED, DELETED, UPDATED
+from workers.error_worker import retry_with_backoff
 
 
+# Object metadata key holding the SHA-256 of the object body
+CONTENT_HASH_KEY = "content-sha256"
+# Error codes of a HEAD or GET on a key that does not exist
+MISSING_OBJECT_CODES = {"404", "NoSuchKey", "NotFound"}
+# Compiled once, used for every post title
+_SPECIAL_CHARACTERS = re.compile(r'[^\w\s-]')
+_SEPARATORS = re.compile(r'[-\s]+')
+
 class S3Worker:
     """
     Class used to interact with S3.
     """
-    def __init__(self, bucket_name: str, region_name: str="us-east-1"):
+    def __init__(self, bucket_name: str, region_name: str="us-east-1", change_log=None):
         """
         Class used to interact with S3.
         
         Args:
             bucket_name (str):   Name of the bucket
             region_name (str):   Name of the region
+            change_log (ChangeLogWorker) Optional: records added, updated and deleted keys
         
         Attributes:
             s3 (object):         Boto3 client object
@@ -60,6 +72,7 @@ class S3Worker:
             s3.upload_file("./img/sample.txt", "sample.txt")
             s3.list_objects_in_bucket(bucket_name="my-bucket")
         """
+        self.change_log = change_log
         try:
             self.s3 = boto3.client(service_name="s3", region_name=region_name)
             self.s3.head_bucket(Bucket=bucket_name)
@@ -136,10 +149,39 @@ class S3Worker:
             # If file does not exist, return None
             return False
 
+    def get_content_hash(self, file_name: str):
+        """
+        Method to get the content hash stored on an object.
+
+        Args:
+            file_name (str):              Name of the file to check
+
+        Only a 404 means the object is missing. Throttling and other
+        transient errors are retried with backoff, and anything else is
+        raised, so an existing object is never taken for a new one.
+
+        return: tuple of (exists, content hash or None if the object has none)
+        """
+        try:
+            response = retry_with_backoff(self.s3.head_object, Bucket=self.bucket,
+                                          Key=file_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in MISSING_OBJECT_CODES:
+                return False, None
+            raise
+        return True, response.get("Metadata", {}).get(CONTENT_HASH_KEY)
+
+    def _record_change(self, file_name: str, existed: bool, content_hash: str):
+        if self.change_log is not None:
+            self.change_log.record(file_name, UPDATED if existed else ADDED, content_hash)
+
     def upload_file(self, file_path: str, file_name: str=None):
         """
         Method to upload a file to S3.
 
+        The object is skipped if it already exists with the same
+        content, and replaced if its content changed.
+
         Args:
             file_path (str):              The path to the file to upload
             file_name (str) Optional:     Name of the file to upload
@@ -153,27 +195,44 @@ class S3Worker:
         """
         if self.bucket is None:
             raise ValueError("Bucket name is not set")
-        # Check if the object already exists
-        if self.object_exists(file_name):
-            return None
         if file_name is None:
             path=file_path
             pattern = r'[^/]+$'
             file_name = re.search(pattern, path).group()
+        with open(file_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        # Check if the object already exists
+        exists, existing_hash = self.get_content_hash(file_name)
+        if exists and existing_hash in (None, content_hash):
+            return None
         try:
-            self.s3.upload_file(Filename=file_path, Bucket=self.bucket, Key=file_name)
+            retry_with_backoff(self.s3.upload_file, Filename=file_path,
+                               Bucket=self.bucket, Key=file_name,
+                               ExtraArgs={"Metadata": {CONTENT_HASH_KEY: content_hash}})
+            self._record_change(file_name, exists, content_hash)
             return f"https://{self.bucket}.s3.amazonaws.com/data/{file_name}"
         except Exception as e:
             print(f"Could not upload file {file_name} to bucket {self.bucket}. Error: {e}")
             return None
 
-    def write_file_directly_to_s3(self, file_name: str, data: str):
+    def write_file_directly_to_s3(self, file_name: str, data: str, content_hash: str=None,
+                                  track_change: bool=True):
         """
         Method to writes data directly to S3.
 
+        The SHA-256 of the data is stored in the object metadata. An
+        object that already exists with the same hash, or with no hash
+        (written before hashes were stored), is skipped. One with a
+        different hash is replaced. Writes are recorded in the change log.
+
+        Transient AWS errors are retried with backoff. If the write
+        still fails the error is raised so the caller can record it.
+
         Args:
             file_name (str):              Name of the file to write
             data (str):           Content of the file to write
+            content_hash (str) Optional:  SHA-256 of data if already known
+            track_change (bool):          If False, the write is not recorded in the change log
         
         return: None
         
@@ -183,17 +242,83 @@ class S3Worker:
         """
         if self.bucket is None:
             raise ValueError("Bucket name is not set")
+        if content_hash is None:
+            body = data.encode("utf-8") if isinstance(data, str) else data
+            content_hash = hashlib.sha256(body).hexdigest()
         # Check if the object already exists
-        if self.object_exists(file_name):
+        exists, existing_hash = self.get_content_hash(file_name)
+        if exists and existing_hash in (None, content_hash):
             print(f"Object {file_name} already exists in bucket {self.bucket}.")
             return None
         try:
-            response = self.s3.put_object(Body=data, Bucket=self.bucket, Key=file_name)
+            response = retry_with_backoff(self.s3.put_object, Body=data,
+                                          Bucket=self.bucket, Key=file_name,
+                                          Metadata={CONTENT_HASH_KEY: content_hash})
             if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
+                if track_change:
+                    self._record_change(file_name, exists, content_hash)
                 return {"s3_url": f"https://{self.bucket}.s3.amazonaws.com/data/{file_name}"}
         except Exception as e:
             print(f"Could not write file {file_name} to bucket {self.bucket}. Error: {e}")
-            return None
+            raise
+
+    def write_record(self, record):
+        """
+        Method to write the body of a BlogRecord to S3 under its s3_key.
+
+        Args:
+            record (BlogRecord):          The blog post to write
+
+        return: dict
+
+        :Example:
+            s3 = S3Worker(bucket_name="my-bucket")
+            s3.write_record(record)
+        """
+        return self.write_file_directly_to_s3(file_name=record.s3_key, data=record.body,
+                                              content_hash=record.content_hash)
+
+    def delete_object(self, file_name: str):
+        """
+        Method to delete an object from S3.
+
+        Args:
+            file_name (str):              Name of the file to delete
+
+        return: None
+
+        :Example:
+            s3 = S3Worker(bucket_name="my-bucket")
+            s3.delete_object("sample.txt")
+        """
+        if self.bucket is None:
+            raise ValueError("Bucket name is not set")
+        retry_with_backoff(self.s3.delete_object, Bucket=self.bucket, Key=file_name)
+        if self.change_log is not None:
+            self.change_log.record(file_name, DELETED)
+
+    def write_records(self, records: list) -> list:
+        """
+        Method to write the bodies of many BlogRecords to S3.
+
+        A record that fails does not stop the others.
+
+        Args:
+            records (list):               The blog posts to write
+
+        return: list of (record, exception) tuples for records that failed
+
+        :Example:
+            s3 = S3Worker(bucket_name="my-bucket")
+            failed = s3.write_records(records)
+        """
+        failed = []
+        for record in records:
+            try:
+                self.write_record(record)
+            except Exception as e:
+                failed.append((record, e))
+        return failed
 
     def random_string(self):
         """
@@ -223,12 +348,33 @@ class S3Worker:
         return: str
         """
         # Strip special characters.
-        title = re.sub(r'[^\w\s-]', '', title)
+        title = _SPECIAL_CHARACTERS.sub('', title)
         # Convert the title to lowercase and replace spaces with hyphens.
         _ = title.strip().lower()
-        new_title = re.sub(r'[-\s]+', '-', _)
+        new_title = _SEPARATORS.sub('-', _)
         return new_title
 
+    @staticmethod
+    def generate_key(blog_title: str, date_published: str) -> str:
+        """
+        Generates the S3 key of a blog post from its title and date.
+
+        Args:
+            blog_title (str):            Title of the blog post
+            date_published (str):        Published date of the blog post
+
+        Raises:
+            ValueError: if the title or date is missing
+
+        return: str
+
+        :Example:
+            S3Worker.generate_key("my first blog", "2023-09-24")
+        """
+        if not (date_published and blog_title):
+            raise ValueError("date_published and blog_title are required.")
+        return S3Worker.generate_filename(f"{blog_title} {date_published}")
+
     @ staticmethod
     def generate_filename(blog_string, extension=".txt"):
         """
@@ -0,0 +1,235 @@
+"""
+Buffers parsed posts and writes them to S3 and DynamoDB in batches
+"""
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from workers.blog_record import BlogRecord
+from workers.error_worker import WALInUseError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SinkWorker:
+    """
+    Class used to buffer BlogRecords and flush them to every sink
+
+    Records are appended to a write-ahead log file as soon as they are
+    added, so a crash loses nothing that was parsed. A background thread
+    flushes the buffer when it reaches batch_size records or every
+    flush_interval seconds. Each flush hands the same batch to all sinks
+    at once, so parsing never waits on S3 or DynamoDB.
+
+    A SinkWorker holds a lock on <wal_file>.lock while it is open, so two
+    processes never share a write-ahead log (POSIX only).
+    """
+    def __init__(self, sinks: dict, errors=None, batch_size: int=25,
+                 flush_interval: float=5.0, wal_file: str="sink.wal", after: dict=None,
+                 on_written=None, on_failed=None):
+        """
+        Method to initialize the class
+
+        Args:
+            sinks (dict):                   Name to function that takes a list of
+                                            BlogRecords and returns (record, exception)
+                                            tuples for the ones that failed
+            errors (ErrorWorker) Optional:  ErrorWorker to record failed records
+            batch_size (int):               Number of records that triggers a flush
+            flush_interval (float):         Seconds between flushes of a partial batch
+            wal_file (str):                 Path of the write-ahead log
+
+        Raises:
+            WALInUseError: if another process holds the write-ahead log
+            after (dict) Optional:          Sinks in the same form that run after the
+                                            sinks above, on the records all of them wrote.
+                                            Their failures are recorded as warnings
+            on_written (callable) Optional: Called from the flush thread with the
+                                            records of a batch that every sink wrote
+            on_failed (callable) Optional:  Called from the flush thread with (record,
+                                            exception) tuples for the records of a batch
+                                            that any sink failed to write. Returns the
+                                            records that will be retried, which are not
+                                            recorded as failed
+
+        :Example:
+            sink = SinkWorker({"s3": s3.write_records, "dynamodb": db.post_records})
+            sink.add(record)
+            sink.close()
+        """
+        self.sinks = sinks
+        self.after = after or {}
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.errors = errors
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.wal_file = wal_file
+        self._wal_lock = self._lock_wal()
+        self.flushed = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._segment = 0
+        self._pool = ThreadPoolExecutor(max_workers=max(len(sinks), len(self.after), 1),
+                                        thread_name_prefix="sink")
+        self._replay()
+        self._wal = open(self.wal_file, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="sink-flusher", daemon=True)
+        self._thread.start()
+
+    def _lock_wal(self):
+        """
+        Locks the write-ahead log for this process
+        """
+        lock = open(f"{self.wal_file}.lock", "a", encoding="utf-8")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                lock.close()
+                raise WALInUseError(f"{self.wal_file} is used by another process.") from e
+        return lock
+
+    def _replay(self):
+        """
+        Loads records left in the write-ahead log by a run that did not finish
+        """
+        pending = [path for path in sorted(glob.glob(f"{glob.escape(self.wal_file)}.*"))
+                   if path != f"{self.wal_file}.lock"]
+        if os.path.exists(self.wal_file):
+            pending.append(self.wal_file)
+        for path in pending:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._buffer.append(BlogRecord.from_json(line))
+        if self._buffer:
+            print(f"Replaying {len(self._buffer)} unflushed records from {self.wal_file}")
+            # Rewrite them as one segment so they are removed after their flush
+            with open(f"{self.wal_file}.replay", "w", encoding="utf-8") as f:
+                for record in self._buffer:
+                    f.write(record.to_json() + "\n")
+            for path in pending:
+                if path != f"{self.wal_file}.replay":
+                    os.remove(path)
+
+    def add(self, record: BlogRecord):
+        """
+        Adds a record to the buffer
+
+        Args:
+            record (BlogRecord): the blog post to write
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("SinkWorker is closed")
+            self._wal.write(record.to_json() + "\n")
+            self._wal.flush()
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        """
+        Background loop that flushes on size or time
+        """
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything in the buffer to all sinks
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                batch, self._buffer = self._buffer, []
+                # Start a new log so records added during the flush are kept
+                self._wal.close()
+                self._segment += 1
+                segment = f"{self.wal_file}.{time.time_ns()}-{self._segment}"
+                os.replace(self.wal_file, segment)
+                self._wal = open(self.wal_file, "a", encoding="utf-8")
+            replay = f"{self.wal_file}.replay"
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start:start + self.batch_size])
+            os.remove(segment)
+            if os.path.exists(replay):
+                os.remove(replay)
+
+    def _write(self, batch: list):
+        """
+        Hands one batch to all sinks at once and records the failures
+        """
+        failures = self._write_to(self.sinks, batch)
+        failed = {}
+        for _, record, error in failures:
+            failed.setdefault(id(record), (record, error))
+        # Later stages only see the records every sink wrote
+        written = [record for record in batch if id(record) not in failed]
+        if written:
+            # The posts are written, so a later stage failing is not a failed post
+            self._record(self._write_to(self.after, written), final=False)
+            if self.on_written is not None:
+                self.on_written(written)
+        retrying = set()
+        if failed and self.on_failed is not None:
+            # Records that will be retried have not failed yet
+            retrying = {id(record) for record in self.on_failed(list(failed.values())) or []}
+        self._record([failure for failure in failures if id(failure[1]) not in retrying])
+        self.flushed += len(batch)
+
+    def _write_to(self, sinks: dict, batch: list) -> list:
+        """
+        Hands one batch to the given sinks at once
+
+        Returns:
+            list: (sink name, record, exception) tuples for every failed write
+        """
+        failures = []
+        futures = {name: self._pool.submit(sink, batch) for name, sink in sinks.items()}
+        for name, future in futures.items():
+            try:
+                failed = future.result()
+            except Exception as e:
+                failed = [(record, e) for record in batch]
+            failures.extend((name, record, error) for record, error in failed)
+        return failures
+
+    def _record(self, failures: list, final: bool=True):
+        """
+        Records failed writes as failed posts, or as warnings if final is False
+        """
+        for name, record, error in failures:
+            if self.errors is None:
+                print(f"Could not write {record.s3_key} to {name}. Error: {error}")
+            elif final:
+                self.errors.record_failure(record.url, error, stage=name)
+            else:
+                self.errors.record_warning(record.url, error, stage=name)
+
+    def close(self):
+        """
+        Flushes the rest of the buffer and stops the background thread
+        """
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self._pool.shutdown()
+        self._wal.close()
+        if os.path.exists(self.wal_file) and os.path.getsize(self.wal_file) == 0:
+            os.remove(self.wal_file)
+        self._wal_lock.close()
@@ -0,0 +1,210 @@
+"""
+Syncs the S3 changes recorded in run manifests to a knowledge base
+"""
+import json
+import os
+import boto3
+from workers.change_worker import DELETED, ChangeLogWorker
+from workers.error_worker import retry_with_backoff
+
+
+class LocalIngestionTarget:
+    """
+    Stand-in for a knowledge base that keeps its documents in a JSON file
+
+    Used to test syncs without Amazon Bedrock.
+    """
+    def __init__(self, path: str="kb_documents.json"):
+        """
+        Method to initialize the class
+
+        Args:
+            path (str):     Path of the JSON file of ingested documents
+        """
+        self.path = path
+        self.documents = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.documents = json.load(f)
+
+    def ingest(self, documents: dict):
+        """
+        Adds or replaces documents
+
+        Args:
+            documents (dict): s3 uri to content hash
+        """
+        self.documents.update(documents)
+        self._save()
+
+    def delete(self, uris: list):
+        """
+        Removes documents
+
+        Args:
+            uris (list): s3 uris to remove
+        """
+        for uri in uris:
+            self.documents.pop(uri, None)
+        self._save()
+
+    def _save(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.documents, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class BedrockKBTarget:
+    """
+    Amazon Bedrock knowledge base with an S3 data source
+    """
+    # Most documents the Bedrock Agent API accepts in one call
+    BATCH_SIZE = 10
+
+    def __init__(self, knowledge_base_id: str, data_source_id: str, region_name: str="us-east-1"):
+        """
+        Method to initialize the class
+
+        Args:
+            knowledge_base_id (str):    ID of the knowledge base
+            data_source_id (str):       ID of the S3 data source of the knowledge base
+            region_name (str):          Name of the region
+        """
+        self.bedrock_agent = boto3.client(service_name="bedrock-agent", region_name=region_name)
+        self.knowledge_base_id = knowledge_base_id
+        self.data_source_id = data_source_id
+
+    def ingest(self, documents: dict):
+        """
+        Ingests documents from S3
+
+        Args:
+            documents (dict): s3 uri to content hash
+        """
+        uris = list(documents)
+        for start in range(0, len(uris), self.BATCH_SIZE):
+            retry_with_backoff(
+                self.bedrock_agent.ingest_knowledge_base_documents,
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                documents=[
+                    {"content": {"dataSourceType": "S3", "s3": {"s3Location": {"uri": uri}}}}
+                    for uri in uris[start:start + self.BATCH_SIZE]
+                ],
+            )
+
+    def delete(self, uris: list):
+        """
+        Removes documents
+
+        Args:
+            uris (list): s3 uris to remove
+        """
+        for start in range(0, len(uris), self.BATCH_SIZE):
+            retry_with_backoff(
+                self.bedrock_agent.delete_knowledge_base_documents,
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                documentIdentifiers=[
+                    {"dataSourceType": "S3", "s3": {"uri": uri}}
+                    for uri in uris[start:start + self.BATCH_SIZE]
+                ],
+            )
+
+
+class SyncWorker:
+    """
+    Class used to send only the S3 changes since the last sync to a target
+    """
+    def __init__(self, target, manifest_dir: str="manifests", state_file: str=None):
+        """
+        Method to initialize the class
+
+        Args:
+            target (object):            LocalIngestionTarget or BedrockKBTarget
+            manifest_dir (str):         Directory run manifests are saved in
+            state_file (str) Optional:  File storing the names of the synced manifests.
+                                        Default: <manifest_dir>/sync_state
+
+        :Example:
+            sync = SyncWorker(LocalIngestionTarget("kb_documents.json"))
+            sync.sync()
+        """
+        self.target = target
+        self.manifest_dir = manifest_dir
+        self.state_file = state_file or os.path.join(manifest_dir, "sync_state")
+
+    def synced_manifests(self) -> set:
+        """
+        Returns the file names of the manifests already synced
+
+        A state file from before manifests were tracked by name holds a
+        single run id. Every manifest up to that run counts as synced.
+        """
+        if not os.path.exists(self.state_file):
+            return set()
+        with open(self.state_file, encoding="utf-8") as f:
+            state = f.read().strip()
+        if not state:
+            return set()
+        try:
+            return set(json.loads(state)["synced"])
+        except (ValueError, TypeError, KeyError):
+            if not os.path.isdir(self.manifest_dir):
+                return set()
+            return {name for name in os.listdir(self.manifest_dir)
+                    if name.endswith(".json") and name[:-5] <= state}
+
+    def get_delta(self) -> tuple:
+        """
+        Collapses the manifests not synced yet into one delta
+
+        Manifests are applied in the order they were saved. A key changed
+        in several runs only appears once, with its latest action.
+
+        Returns:
+            tuple: (documents to ingest as {s3 uri: hash}, s3 uris to delete,
+                    file names of the manifests in the delta)
+        """
+        changes = {}
+        names = []
+        for name, manifest in ChangeLogWorker.load_manifests(self.manifest_dir,
+                                                             self.synced_manifests()):
+            bucket = manifest["bucket"]
+            for key, (action, content_hash) in manifest["changes"].items():
+                changes[f"s3://{bucket}/{key}"] = (action, content_hash)
+            names.append(name)
+        ingest = {uri: h for uri, (action, h) in changes.items() if action != DELETED}
+        delete = [uri for uri, (action, _) in changes.items() if action == DELETED]
+        return ingest, delete, names
+
+    def sync(self) -> dict:
+        """
+        Sends the delta to the target and saves the synced manifest names
+
+        The state is only saved once the target accepted every change,
+        so a failed sync is retried in full next time. A manifest saved
+        by a run that overlapped the last sync is picked up by the next
+        one, even if its name sorts before manifests already synced. The
+        journals of runs that died before saving a manifest are recovered
+        first.
+
+        Returns:
+            dict: number of documents ingested and deleted
+        """
+        ChangeLogWorker.recover(self.manifest_dir)
+        synced = self.synced_manifests()
+        ingest, delete, names = self.get_delta()
+        if not names:
+            print("Nothing to sync.")
+            return {"ingested": 0, "deleted": 0}
+        if ingest:
+            self.target.ingest(ingest)
+        if delete:
+            self.target.delete(delete)
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        with open(self.state_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"synced": sorted(synced | set(names))}, f, indent=1)
+        os.replace(self.state_file + ".tmp", self.state_file)
+        print(f"Synced {len(names)} manifests: {len(ingest)} ingested, {len(delete)} deleted.")
+        return {"ingested": len(ingest), "deleted": len(delete)}